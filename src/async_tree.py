@@ -0,0 +1,155 @@
+import asyncio
+from concurrent.futures import Executor
+from typing import Any, Callable, Optional, Union
+
+from .binary_tree import BinaryTree
+from .durable_tree import DurableTree
+
+
+# asyncio front end for a binary tree that coalesces concurrent requests into batches
+
+LOOKUP = "lookup"
+RANGE = "range"
+INSERT = "insert"
+DELETE = "delete"
+
+
+class AsyncTree:
+    """
+    asyncio front end for a binary tree
+
+    Requests made within one tick of the event loop are coalesced into a single batch, which runs against the tree
+    in an executor so that the event loop is never blocked on the tree. Only one batch runs at a time, so requests
+    made while a batch is running are coalesced into the next one. The requests in a batch are concurrent, so they
+    may take effect in any order: we run the lookups and range queries in ascending order, then apply the inserts
+    and then the deletes with insert_many and delete_many, which sort them once and sweep through the tree
+
+    A request with a bad argument only fails its own future: arguments are checked when the request is made, and
+    if a batched insert_many or delete_many rejects a value with ValueError before changing the tree (as DurableTree
+    does for values its log cannot hold), we fall back to applying its requests one at a time. Any other exception
+    may come after the tree has changed (a failed fsync in DurableTree, say), so it fails every request in the group
+    rather than being retried
+    """
+
+    def __init__(self, tree: Union[BinaryTree, DurableTree], executor: Optional[Executor] = None):
+        """Wrap a tree, running batches in the given executor or the event loop's default one"""
+        self.tree: Union[BinaryTree, DurableTree] = tree
+        self.executor: Optional[Executor] = executor
+        self.pending: list[tuple[str, Any, asyncio.Future]] = []
+        # Set while a batch is scheduled or running
+        self.busy: bool = False
+        self.batches: int = 0
+
+    def submit(self, operation: str, argument: Any) -> asyncio.Future:
+        """Queue a request for the next batch and return a future for its result"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        arguments = argument if operation == RANGE else (argument,)
+        if not all(isinstance(value, int) for value in arguments):
+            future.set_exception(TypeError(f"{operation} expects integers, not {argument!r}"))
+            return future
+        self.pending.append((operation, argument, future))
+        if not self.busy:
+            self.busy = True
+            # Callbacks scheduled now run after everything already ready in this tick, which may add requests
+            loop.call_soon(self.flush, loop)
+        return future
+
+    def flush(self, loop: asyncio.AbstractEventLoop):
+        """Run the pending requests as a batch in the executor"""
+        batch = self.pending
+        self.pending = []
+        self.batches += 1
+        try:
+            running = loop.run_in_executor(self.executor, self.execute, batch)
+        except Exception as error:
+            # The executor could not take the batch (it may have been shut down), so the batch fails as a whole
+            for _, _, future in batch:
+                if not future.cancelled():
+                    future.set_exception(error)
+            self.busy = False
+            return
+        running.add_done_callback(lambda done: self.finish(loop, batch, done))
+
+    def execute(self, batch: list[tuple[str, Any, asyncio.Future]]) -> list[tuple[bool, Any]]:
+        """
+        Apply a batch of requests to the tree
+
+        Return, in the order of the batch, whether each request succeeded along with its result or exception
+        """
+        results: list[tuple[bool, Any]] = [(False, None)] * len(batch)
+        indices = {LOOKUP: [], RANGE: [], INSERT: [], DELETE: []}
+        for index, (operation, _, _) in enumerate(batch):
+            indices[operation].append(index)
+
+        for operation, apply in ((LOOKUP, self.tree.lookup), (RANGE, lambda bounds: self.tree.range(*bounds))):
+            for index in sorted(indices[operation], key=lambda index: batch[index][1]):
+                results[index] = AsyncTree.attempt(apply, batch[index][1])
+        for operation, apply_many, apply in (
+            (INSERT, self.tree.insert_many, self.tree.insert),
+            (DELETE, self.tree.delete_many, self.tree.delete),
+        ):
+            if not indices[operation]:
+                continue
+            try:
+                applied = apply_many([batch[index][1] for index in indices[operation]])
+            except ValueError:
+                for index in indices[operation]:
+                    results[index] = AsyncTree.attempt(apply, batch[index][1])
+                continue
+            except Exception as error:
+                for index in indices[operation]:
+                    results[index] = (False, error)
+                continue
+            for index, result in zip(indices[operation], applied):
+                results[index] = (True, result)
+        return results
+
+    @staticmethod
+    def attempt(apply: Callable[[Any], Any], argument: Any) -> tuple[bool, Any]:
+        """Apply a single request and return whether it succeeded along with its result or exception"""
+        try:
+            return True, apply(argument)
+        except Exception as error:
+            return False, error
+
+    def finish(
+        self, loop: asyncio.AbstractEventLoop, batch: list[tuple[str, Any, asyncio.Future]], done: asyncio.Future
+    ):
+        """Hand each request in a finished batch its result, then run the next batch if there is one"""
+        error = None if done.cancelled() else done.exception()
+        results = None if done.cancelled() or error else done.result()
+        for index, (_, _, future) in enumerate(batch):
+            # The caller may have stopped waiting, but the request has still been applied
+            if future.cancelled():
+                continue
+            if done.cancelled():
+                future.cancel()
+            elif error:
+                future.set_exception(error)
+            else:
+                succeeded, result = results[index]
+                if succeeded:
+                    future.set_result(result)
+                else:
+                    future.set_exception(result)
+        if self.pending:
+            self.flush(loop)
+        else:
+            self.busy = False
+
+    async def lookup(self, value: int) -> bool:
+        """Look up a value in the tree and return whether it exists"""
+        return await self.submit(LOOKUP, value)
+
+    async def range(self, low: int, high: int) -> list[int]:
+        """Return a list of the values in the tree between low and high (inclusive) in ascending order"""
+        return await self.submit(RANGE, (low, high))
+
+    async def insert(self, value: int) -> bool:
+        """Insert a value into the tree and return whether it was inserted"""
+        return await self.submit(INSERT, value)
+
+    async def delete(self, value: int) -> bool:
+        """Delete a value from the tree and return whether it was found"""
+        return await self.submit(DELETE, value)
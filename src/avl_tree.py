@@ -20,6 +20,7 @@ class AVLTree(BinaryTree):
 
     def __init__(self):
         self.root: AVLTreeNode = None
+        self.size: int = 0
 
     @staticmethod
     def get_balance(node: AVLTreeNode) -> int:
@@ -116,12 +117,14 @@ class AVLTree(BinaryTree):
         """
         if not self.root:
             self.root = AVLTreeNode(value)
+            self.size += 1
             return True
         
         if self.lookup(value):
             return False
         
         self.root = self.recursive_insert(self.root, value)
+        self.size += 1
         return True
     
     def delete(self, value: int) -> bool:
@@ -129,3 +132,30 @@ class AVLTree(BinaryTree):
         if not self.lookup(value):
             return False
         pass
+
+    # Small batches of inserts use the default sweep_insert, which searches from the root for every value: the
+    # recursive insert rebalances on the way back up without parent pointers, so there is no finger to resume from
+
+    def sweep_delete(self, batch: list[int]) -> set[int]:
+        """
+        Delete a sorted batch and return the values that were found
+
+        There is no single-value delete to sweep with yet, so every batch is applied by rebuilding
+        """
+        return self.merge_delete(batch)
+
+    def build(self, values: list[int], low: int = 0, high: Optional[int] = None) -> Optional[AVLTreeNode]:
+        """Build a balanced subtree from values[low:high], which must be sorted and distinct"""
+        if high is None:
+            high = len(values)
+        if low >= high:
+            return None
+        middle = (low + high) // 2
+        node = AVLTreeNode(values[middle])
+        node.left = self.build(values, low, middle)
+        node.right = self.build(values, middle + 1, high)
+        node.height = 1 + max(
+            node.left.height if node.left else 0,
+            node.right.height if node.right else 0
+        )
+        return node
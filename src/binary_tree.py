@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import Iterable, Optional
 
 
 # Abstract base classes for binary trees
@@ -16,46 +16,177 @@ class BinaryTreeNode():
 class BinaryTree(ABC):
     """Binary tree abstract base class"""
 
+    # Batches with more distinct values than this fraction of the tree's size are applied by rebuilding the tree
+    rebuild_ratio: float = 1.0
+
     def __init__(self):
         self.root: BinaryTreeNode = None
+        self.size: int = 0
+
+    def __len__(self) -> int:
+        return self.size
 
     @abstractmethod
     def insert(self, value: int) -> bool:
         pass
 
+    def find(self, value: int) -> Optional[BinaryTreeNode]:
+        """Find the node holding a value, or None if there is none"""
+        current = self.root
+        while current:
+            if value == current.value:
+                return current
+            elif value < current.value:
+                current = current.left
+            else:
+                current = current.right
+        return None
+
     def lookup(self, value: int) -> bool:
         """Look up a value in the tree and return whether it exists"""
-        if not self.root:
-            return False
-        else:
-            current = self.root
-            while current:
-                if value == current.value:
-                    return True
-                elif value < current.value:
-                    current = current.left
-                else:
-                    current = current.right
-            return False
+        return self.find(value) is not None
 
     @abstractmethod
     def delete(self, value: int) -> bool:
         pass
 
-    def list(self) -> list[int]:
-        """Return a list of the values in the tree in ascending order"""
-        to_return = []
-        node_stack = [self.root]
-        visited = set()
-        while node_stack:
-            node = node_stack.pop()
-            if not node:
+    @abstractmethod
+    def build(self, values: list[int]) -> Optional[BinaryTreeNode]:
+        """Build a balanced subtree from a list of sorted, distinct values and return its root"""
+        pass
+
+    def rebuild(self, values: list[int]):
+        """Replace the contents of the tree with a list of sorted, distinct values in linear time"""
+        self.root = self.build(values)
+        self.size = len(values)
+
+    @staticmethod
+    def batch_results(values: list[int], applied: set[int]) -> list[bool]:
+        """
+        Map the set of values a batch applied back onto the batch order
+
+        Only the first occurrence of a repeated value is reported as applied, as with one call per value
+        """
+        results = []
+        for value in values:
+            results.append(value in applied)
+            applied.discard(value)
+        return results
+
+    def use_rebuild(self, batch: list[int]) -> bool:
+        """Return whether a sorted batch is large enough relative to the tree to apply by rebuilding"""
+        return len(batch) > self.rebuild_ratio * self.size
+
+    def sweep_insert(self, batch: list[int]) -> set[int]:
+        """
+        Insert a sorted batch in ascending order and return the values that were inserted
+
+        This searches from the root for every value; engines that can resume each search from the previous
+        position (a finger) override it
+        """
+        return {value for value in batch if self.insert(value)}
+
+    def sweep_delete(self, batch: list[int]) -> set[int]:
+        """
+        Delete a sorted batch in ascending order and return the values that were found
+
+        This searches from the root for every value; engines that can resume each search from the previous
+        position (a finger) override it
+        """
+        return {value for value in batch if self.delete(value)}
+
+    def merge_insert(self, batch: list[int]) -> set[int]:
+        """Merge a sorted batch into the in-order values, rebuild the tree, and return the values inserted"""
+        current = self.list()
+        merged = []
+        inserted = set()
+        i = 0
+        for value in batch:
+            while i < len(current) and current[i] < value:
+                merged.append(current[i])
+                i += 1
+            if i < len(current) and current[i] == value:
                 continue
-            if node.value not in visited:
-                visited.add(node.value)
-                node_stack.append(node.right)
+            merged.append(value)
+            inserted.add(value)
+        merged.extend(current[i:])
+        self.rebuild(merged)
+        return inserted
+
+    def merge_delete(self, batch: list[int]) -> set[int]:
+        """Remove a sorted batch from the in-order values, rebuild the tree, and return the values found"""
+        kept = []
+        deleted = set()
+        j = 0
+        for value in self.list():
+            while j < len(batch) and batch[j] < value:
+                j += 1
+            if j < len(batch) and batch[j] == value:
+                deleted.add(value)
+            else:
+                kept.append(value)
+        self.rebuild(kept)
+        return deleted
+
+    def insert_many(self, values: Iterable[int]) -> list[bool]:
+        """
+        Insert a batch of values and return whether each one was inserted
+
+        The batch is sorted once; small batches are applied in a single ascending sweep, while large ones are
+        merged with the in-order values and the tree is rebuilt in linear time
+        """
+        values = list(values)
+        batch = sorted(set(values))
+        if self.use_rebuild(batch):
+            inserted = self.merge_insert(batch)
+        else:
+            inserted = self.sweep_insert(batch)
+        return BinaryTree.batch_results(values, inserted)
+
+    def delete_many(self, values: Iterable[int]) -> list[bool]:
+        """
+        Delete a batch of values and return whether each one was found
+
+        The batch is sorted once; small batches are applied in a single ascending sweep, while large ones are
+        filtered out of the in-order values and the tree is rebuilt in linear time
+        """
+        values = list(values)
+        batch = sorted(set(values))
+        if self.use_rebuild(batch):
+            deleted = self.merge_delete(batch)
+        else:
+            deleted = self.sweep_delete(batch)
+        return BinaryTree.batch_results(values, deleted)
+
+    def nodes(self, low: Optional[int] = None, high: Optional[int] = None) -> list[BinaryTreeNode]:
+        """
+        Return the nodes of the tree in ascending order of value
+
+        If low or high is given, only the nodes with values between them (inclusive) are returned, and we skip the
+        subtrees that lie entirely outside of that range
+        """
+        to_return = []
+        node_stack = []
+        node = self.root
+        while node_stack or node:
+            if node:
+                if low is not None and node.value < low:
+                    node = node.right
+                    continue
                 node_stack.append(node)
-                node_stack.append(node.left)
+                node = node.left
             else:
-                to_return.append(node.value)
+                node = node_stack.pop()
+                if high is not None and node.value > high:
+                    break
+                to_return.append(node)
+                node = node.right
         return to_return
+
+    def range(self, low: int, high: int) -> list[int]:
+        """Return a list of the values in the tree between low and high (inclusive) in ascending order"""
+        return [node.value for node in self.nodes(low, high)]
+
+    def list(self) -> list[int]:
+        """Return a list of the values in the tree in ascending order"""
+        return [node.value for node in self.nodes()]
@@ -0,0 +1,270 @@
+import os
+import struct
+import threading
+import zlib
+from array import array
+from typing import Iterable
+
+from .binary_tree import BinaryTree
+
+
+# Durable wrapper around a binary tree, backed by a write-ahead log and snapshots
+
+# Each log record is an operation code, the value, and a CRC32 of the two so that a torn final write is detected
+RECORD = struct.Struct("<BqI")
+INSERT = 1
+DELETE = 2
+
+# A snapshot is the number of values followed by the values in ascending order as 64-bit integers
+SNAPSHOT_HEADER = struct.Struct("<Q")
+
+LOG_NAME = "wal"
+SNAPSHOT_NAME = "snapshot"
+
+
+def pack_record(operation: int, value: int) -> bytes:
+    """Pack an operation on a value into a log record, raising ValueError if the value does not fit in one"""
+    try:
+        body = struct.pack("<Bq", operation, value)
+    except struct.error as error:
+        raise ValueError(f"{value!r} is not a 64-bit integer") from error
+    return body + struct.pack("<I", zlib.crc32(body))
+
+
+class DurableTree:
+    """
+    Binary tree whose updates survive crashes
+
+    Successful inserts and deletes are applied to the wrapped tree and appended to a write-ahead log, and they
+    return only once the log has been fsynced. Writers that arrive while another writer is fsyncing wait for it to
+    finish, and the next of them to run fsyncs everything buffered in the meantime at once (group commit). Every
+    checkpoint_interval logged operations, the sorted values are written to a snapshot file and the log is emptied,
+    so that recovery rebuilds the tree from the snapshot in linear time and replays only the log written since
+
+    Every answer, including a failed insert or delete and every read, waits until the log is durable up to the
+    state of the tree it was computed from, so no caller is told about an update that a crash could still lose
+
+    If writing or fsyncing the log fails, the caller gets the OSError but the outcome of its update is unknown: the
+    update stays applied to the tree, later readers see it, and the next successful sync makes it durable. Callers
+    must not treat the exception as meaning the update was not applied
+    """
+
+    def __init__(self, tree: BinaryTree, directory: str, checkpoint_interval: int = 100000):
+        """Wrap an empty tree, recovering into it whatever was last committed in the directory"""
+        if tree.root:
+            raise ValueError("The tree to wrap must be empty")
+        if checkpoint_interval < 1:
+            raise ValueError("checkpoint_interval must be positive")
+        self.tree: BinaryTree = tree
+        self.directory: str = directory
+        self.checkpoint_interval: int = checkpoint_interval
+
+        # The lock guards the tree and the log buffer; writers wait on the condition for their records to be synced
+        self.lock = threading.Lock()
+        self.synced = threading.Condition(self.lock)
+        self.buffer = bytearray()
+        self.logged: int = 0
+        self.durable: int = 0
+        self.syncing: bool = False
+        self.syncs: int = 0
+        self.since_checkpoint: int = 0
+
+        os.makedirs(directory, exist_ok=True)
+        created = not os.path.exists(self.path(LOG_NAME))
+        self.recover()
+        self.log_file = open(self.path(LOG_NAME), "ab")
+        if created:
+            # The log's directory entry must survive a crash along with the records synced into it
+            self.sync_directory()
+
+    def path(self, name: str) -> str:
+        """Return the path of a file in the directory"""
+        return os.path.join(self.directory, name)
+
+    def sync_directory(self):
+        """Fsync the directory so that files created or renamed in it survive a crash"""
+        directory = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+    def recover(self):
+        """Load the snapshot into the tree, replay the log on top of it, and cut off any torn final record"""
+        snapshot_path = self.path(SNAPSHOT_NAME)
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, "rb") as snapshot:
+                (count,) = SNAPSHOT_HEADER.unpack(snapshot.read(SNAPSHOT_HEADER.size))
+                values = array("q")
+                values.fromfile(snapshot, count)
+            self.tree.rebuild(values.tolist())
+
+        log_path = self.path(LOG_NAME)
+        if not os.path.exists(log_path):
+            return
+        with open(log_path, "rb") as log:
+            data = log.read()
+        valid = 0
+        for offset in range(0, len(data) - RECORD.size + 1, RECORD.size):
+            operation, value, checksum = RECORD.unpack_from(data, offset)
+            if checksum != zlib.crc32(data[offset:offset + RECORD.size - 4]):
+                break
+            # Replaying is idempotent, so a log that a crash left behind after its checkpoint is harmless
+            if operation == INSERT:
+                self.tree.insert(value)
+            else:
+                self.tree.delete(value)
+            valid = offset + RECORD.size
+        self.since_checkpoint = valid // RECORD.size
+        if valid < len(data):
+            with open(log_path, "r+b") as log:
+                log.truncate(valid)
+                os.fsync(log.fileno())
+
+    def log(self, records: list[bytes]) -> int:
+        """Buffer packed log records and return the number of records logged so far"""
+        for record in records:
+            self.buffer += record
+        self.logged += len(records)
+        self.since_checkpoint += len(records)
+        return self.logged
+
+    def sync_buffer(self):
+        """Write out and fsync the log buffer; must be called with the lock held and no other sync in progress"""
+        data = bytes(self.buffer)
+        target = self.logged
+        self.buffer.clear()
+        self.syncing = True
+        # Let other writers apply and buffer their updates while we wait on the disk
+        self.lock.release()
+        failed = True
+        try:
+            self.log_file.write(data)
+            self.log_file.flush()
+            os.fsync(self.log_file.fileno())
+            failed = False
+        finally:
+            self.lock.acquire()
+            self.syncing = False
+            self.synced.notify_all()
+            if failed:
+                # Put the records back so that the next sync retries them rather than reporting them durable
+                self.buffer[0:0] = data
+        self.durable = target
+        self.syncs += 1
+
+    def commit(self, position: int):
+        """Wait until the log is durable up to a position, leading a group commit if no sync is in progress"""
+        while self.durable < position:
+            if self.syncing:
+                self.synced.wait()
+            else:
+                self.sync_buffer()
+        if self.since_checkpoint >= self.checkpoint_interval:
+            self.checkpoint_locked()
+
+    def checkpoint(self):
+        """Write a snapshot of the tree and empty the log"""
+        with self.lock:
+            self.checkpoint_locked()
+
+    def checkpoint_locked(self):
+        """Write a snapshot of the tree and empty the log; must be called with the lock held"""
+        # Other writers may buffer more records whenever a sync releases the lock
+        while self.syncing or self.buffer:
+            if self.syncing:
+                self.synced.wait()
+            else:
+                self.sync_buffer()
+
+        values = array("q", self.tree.list())
+        temporary_path = self.path(SNAPSHOT_NAME + ".tmp")
+        with open(temporary_path, "wb") as snapshot:
+            snapshot.write(SNAPSHOT_HEADER.pack(len(values)))
+            values.tofile(snapshot)
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        os.replace(temporary_path, self.path(SNAPSHOT_NAME))
+        self.sync_directory()
+
+        self.log_file.truncate(0)
+        os.fsync(self.log_file.fileno())
+        self.since_checkpoint = 0
+
+    def insert(self, value: int) -> bool:
+        """Insert a value into the tree, durably, and return whether it was inserted"""
+        # Packing the record first rejects values the log cannot hold before the tree is touched
+        record = pack_record(INSERT, value)
+        with self.lock:
+            inserted = self.tree.insert(value)
+            self.commit(self.log([record] if inserted else []))
+            return inserted
+
+    def delete(self, value: int) -> bool:
+        """Delete a value from the tree, durably, and return whether it was found"""
+        record = pack_record(DELETE, value)
+        with self.lock:
+            deleted = self.tree.delete(value)
+            self.commit(self.log([record] if deleted else []))
+            return deleted
+
+    def insert_many(self, values: Iterable[int]) -> list[bool]:
+        """Insert a batch of values into the tree with a single commit and return whether each was inserted"""
+        values = list(values)
+        records = [pack_record(INSERT, value) for value in values]
+        with self.lock:
+            results = self.tree.insert_many(values)
+            self.commit(self.log([record for record, inserted in zip(records, results) if inserted]))
+            return results
+
+    def delete_many(self, values: Iterable[int]) -> list[bool]:
+        """Delete a batch of values from the tree with a single commit and return whether each was found"""
+        values = list(values)
+        records = [pack_record(DELETE, value) for value in values]
+        with self.lock:
+            results = self.tree.delete_many(values)
+            self.commit(self.log([record for record, deleted in zip(records, results) if deleted]))
+            return results
+
+    def lookup(self, value: int) -> bool:
+        """Look up a value in the tree and return whether it exists"""
+        with self.lock:
+            found = self.tree.lookup(value)
+            self.commit(self.logged)
+            return found
+
+    def range(self, low: int, high: int) -> list[int]:
+        """Return a list of the values in the tree between low and high (inclusive) in ascending order"""
+        with self.lock:
+            values = self.tree.range(low, high)
+            self.commit(self.logged)
+            return values
+
+    def list(self) -> list[int]:
+        """Return a list of the values in the tree in ascending order"""
+        with self.lock:
+            values = self.tree.list()
+            self.commit(self.logged)
+            return values
+
+    def __len__(self) -> int:
+        with self.lock:
+            size = len(self.tree)
+            self.commit(self.logged)
+            return size
+
+    def close(self):
+        """Sync any buffered log records and close the log"""
+        with self.lock:
+            while self.syncing or self.buffer:
+                if self.syncing:
+                    self.synced.wait()
+                else:
+                    self.sync_buffer()
+            self.log_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
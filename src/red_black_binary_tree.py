@@ -17,6 +17,8 @@ class RedBlackBinaryTreeNode(BinaryTreeNode):
     def __init__(self, value: int) -> None:
         self.value: int = value
         self.red: bool = True
+        # Set when the value has been lazily deleted but the node is still in the tree
+        self.deleted: bool = False
         self.parent: Optional[RedBlackBinaryTreeNode] = None
         self.left: Optional[RedBlackBinaryTreeNode] = None
         self.right: Optional[RedBlackBinaryTreeNode] = None
@@ -27,6 +29,21 @@ class RedBlackBinaryTree(BinaryTree):
 
     root: Optional[RedBlackBinaryTreeNode]
 
+    def __init__(self, lazy: bool = False, compaction_threshold: float = 0.5):
+        """
+        Initialize an empty tree
+
+        If lazy is set, delete only marks the node holding the value as a tombstone, which lookups, iteration and
+        the size skip. Once more than compaction_threshold of the nodes are tombstones, the tree compacts itself by
+        rebuilding from the live values in linear time
+        """
+        super().__init__()
+        if not 0 < compaction_threshold <= 1:
+            raise ValueError("compaction_threshold must be in (0, 1]")
+        self.lazy: bool = lazy
+        self.compaction_threshold: float = compaction_threshold
+        self.tombstones: int = 0
+
     # Remove node's parent and plug the node into its grandparent
     def remove_intermediate_generation(self, node: RedBlackBinaryTreeNode):
         """Remove node's parent and plug the node into its grandparent"""
@@ -117,38 +134,118 @@ class RedBlackBinaryTree(BinaryTree):
                 self.rotate_left(parent)
                 parent.red = False
 
-    def insert(self, value: int) -> bool:
+    def insert_below(self, current: RedBlackBinaryTreeNode, value: int) -> tuple[RedBlackBinaryTreeNode, bool]:
         """
-        Insert the value into the tree and return whether the insertion is successful
-        
-        Duplicate values are not inserted
+        Insert the value into the subtree rooted at current and return the node holding it and whether it was inserted
+
+        The subtree must be one that the value belongs in, such as the whole tree
         """
-        node_to_insert = RedBlackBinaryTreeNode(value)
-        if not self.root:
-            self.root = node_to_insert
-            self.fix_tree_after_insert(node_to_insert)
-            return True
-        current = self.root
         while True:
             if value == current.value:
-                return False
+                if current.deleted:
+                    # Reinserting a lazily deleted value revives its node in place
+                    current.deleted = False
+                    self.tombstones -= 1
+                    self.size += 1
+                    return current, True
+                return current, False
             elif value < current.value:
                 if not current.left:
+                    node_to_insert = RedBlackBinaryTreeNode(value)
                     node_to_insert.parent = current
                     current.left = node_to_insert
+                    self.size += 1
                     self.fix_tree_after_insert(node_to_insert)
-                    return True
+                    return node_to_insert, True
                 else:
                     current = current.left
             else:
                 if not current.right:
+                    node_to_insert = RedBlackBinaryTreeNode(value)
                     node_to_insert.parent = current
                     current.right = node_to_insert
+                    self.size += 1
                     self.fix_tree_after_insert(node_to_insert)
-                    return True
+                    return node_to_insert, True
                 else:
                     current = current.right
 
+    def insert(self, value: int) -> bool:
+        """
+        Insert the value into the tree and return whether the insertion is successful
+        
+        Duplicate values are not inserted
+        """
+        if not self.root:
+            self.root = RedBlackBinaryTreeNode(value)
+            self.size += 1
+            self.fix_tree_after_insert(self.root)
+            return True
+        return self.insert_below(self.root, value)[1]
+
+    @staticmethod
+    def climb(node: RedBlackBinaryTreeNode, value: int) -> RedBlackBinaryTreeNode:
+        """
+        Climb from a node holding a smaller value to the lowest ancestor whose subtree the value belongs in
+
+        Rotations keep the tree ordered, so this holds even if the tree has been rebalanced since we reached the node
+        """
+        while node.parent:
+            parent = node.parent
+            # Everything below parent.left is smaller than parent.value
+            if parent.left == node and value < parent.value:
+                return node
+            node = parent
+        return node
+
+    def sweep_insert(self, batch: list[int]) -> set[int]:
+        """Insert a sorted batch in one ascending pass, resuming each search from the previously inserted node"""
+        inserted = set()
+        finger = None
+        for value in batch:
+            if not finger:
+                if self.insert(value):
+                    inserted.add(value)
+                finger = self.root
+                continue
+            finger, was_inserted = self.insert_below(RedBlackBinaryTree.climb(finger, value), value)
+            if was_inserted:
+                inserted.add(value)
+        return inserted
+
+    def build(self, values: list[int]) -> Optional[RedBlackBinaryTreeNode]:
+        """Build a balanced subtree from a list of sorted, distinct values"""
+        return self.link([RedBlackBinaryTreeNode(value) for value in values])
+
+    def link(self, nodes: list[RedBlackBinaryTreeNode]) -> Optional[RedBlackBinaryTreeNode]:
+        """
+        Link a list of nodes in ascending order of value into a balanced subtree and return its root
+
+        Every level but the deepest is full, so coloring only the deepest level red satisfies invariants 4 and 5
+        """
+        root = self.link_subtree(nodes, 0, len(nodes), 0, len(nodes).bit_length() - 1)
+        if root:
+            root.red = False
+            root.parent = None
+        return root
+
+    def link_subtree(
+        self, nodes: list[RedBlackBinaryTreeNode], low: int, high: int, depth: int, red_depth: int
+    ) -> Optional[RedBlackBinaryTreeNode]:
+        """Link nodes[low:high] into a balanced subtree whose root sits at the given depth"""
+        if low >= high:
+            return None
+        middle = (low + high) // 2
+        node = nodes[middle]
+        node.red = depth == red_depth
+        node.left = self.link_subtree(nodes, low, middle, depth + 1, red_depth)
+        node.right = self.link_subtree(nodes, middle + 1, high, depth + 1, red_depth)
+        if node.left:
+            node.left.parent = node
+        if node.right:
+            node.right.parent = node
+        return node
+
     def delete_from_parent(self, node: RedBlackBinaryTreeNode):
         """Delete a node from its parent"""
         # Assumes the existence of a parent when this call is made
@@ -265,11 +362,46 @@ class RedBlackBinaryTree(BinaryTree):
             sibling.red = False
             # To finish, we need to reinsert parent.value, and insert maintains all the invariants
             self.insert(parent.value)
+            # Reinserting parent.value does not grow the tree
+            self.size -= 1
         else:
             self.handle_deletion_black_no_child_black_parent_black_sibling(node)
 
+    def lookup(self, value: int) -> bool:
+        """Look up a value in the tree and return whether it exists, skipping lazily deleted values"""
+        node = self.find(value)
+        return node is not None and not node.deleted
+
+    def nodes(self, low: Optional[int] = None, high: Optional[int] = None) -> list[RedBlackBinaryTreeNode]:
+        """Return the nodes of the tree in ascending order of value, skipping lazily deleted ones"""
+        return [node for node in super().nodes(low, high) if not node.deleted]
+
+    def rebuild(self, values: list[int]):
+        """Replace the contents of the tree with a list of sorted, distinct values in linear time"""
+        super().rebuild(values)
+        self.tombstones = 0
+
+    def compact(self):
+        """Drop the nodes of lazily deleted values by relinking the live nodes into a balanced tree"""
+        self.root = self.link(self.nodes())
+        self.tombstones = 0
+
+    def lazy_delete(self, value: int) -> bool:
+        """Mark the node holding the value as deleted without restructuring and return whether the value is found"""
+        node = self.find(value)
+        if not node or node.deleted:
+            return False
+        node.deleted = True
+        self.tombstones += 1
+        self.size -= 1
+        if self.tombstones > self.compaction_threshold * (self.size + self.tombstones):
+            self.compact()
+        return True
+
     def delete(self, value: int) -> bool:
         """Delete the value from the tree and return whether the element is found"""
+        if self.lazy:
+            return self.lazy_delete(value)
         if not self.root:
             return False
         current = self.root
@@ -311,6 +443,7 @@ class RedBlackBinaryTree(BinaryTree):
                         self.delete_from_parent(current.right)
                     else:
                         self.handle_deletion_black_no_child(current)
+                self.size -= 1
                 return True
         # Value not found in the tree
         return False
@@ -1,3 +1,4 @@
+import math
 from typing import Optional
 
 from .binary_tree import BinaryTree, BinaryTreeNode
@@ -16,16 +17,35 @@ class SimpleBinaryTree(BinaryTree):
 
     root: Optional[SimpleBinaryTreeNode]
 
+    def __init__(self, alpha: Optional[float] = None):
+        """
+        Initialize an empty tree
+
+        If alpha (strictly between 0.5 and 1) is given, the tree runs as a scapegoat tree: an insertion landing
+        deeper than log base 1/alpha of the size rebuilds the subtree of the lowest ancestor that is more than
+        alpha-weight-unbalanced, and deletions rebuild the whole tree once the size falls below alpha times its
+        size at the last full rebuild. Smaller alphas keep the tree more balanced at the cost of more rebuilding
+        """
+        super().__init__()
+        if alpha is not None and not 0.5 < alpha < 1:
+            raise ValueError("alpha must be strictly between 0.5 and 1")
+        self.alpha: Optional[float] = alpha
+        self.max_size: int = 0
+
     def insert(self, value: int) -> bool:
         """
         Insert a value into the tree and return whether it was inserted
         
         Duplicate values are not allowed
         """
+        if self.alpha is not None:
+            return self.scapegoat_insert(value)
+
         node_to_insert = SimpleBinaryTreeNode(value)
 
         if not self.root:
             self.root = node_to_insert
+            self.size += 1
             return True
             
         current = self.root
@@ -35,16 +55,145 @@ class SimpleBinaryTree(BinaryTree):
             elif value < current.value:
                 if not current.left:
                     current.left = node_to_insert
+                    self.size += 1
                     return True
                 else:
                     current = current.left
             else:
                 if not current.right:
-                    current.right = SimpleBinaryTreeNode(value)
+                    current.right = node_to_insert
+                    self.size += 1
                     return True
                 else:
                     current = current.right
 
+    def scapegoat_insert(self, value: int) -> bool:
+        """Insert a value into the tree in scapegoat mode, rebuilding a subtree if the value lands too deep"""
+        node_to_insert = SimpleBinaryTreeNode(value)
+
+        if not self.root:
+            self.root = node_to_insert
+            self.size += 1
+            self.max_size = max(self.max_size, self.size)
+            return True
+
+        current = self.root
+        path = []
+        while True:
+            path.append(current)
+            if value == current.value:
+                return False
+            elif value < current.value:
+                if not current.left:
+                    current.left = node_to_insert
+                    break
+                else:
+                    current = current.left
+            else:
+                if not current.right:
+                    current.right = node_to_insert
+                    break
+                else:
+                    current = current.right
+
+        path.append(node_to_insert)
+        self.size += 1
+        self.max_size = max(self.max_size, self.size)
+        self.rebuild_scapegoat(path)
+        return True
+
+    @staticmethod
+    def count(node: Optional[SimpleBinaryTreeNode]) -> int:
+        """Count the nodes in a subtree"""
+        total = 0
+        node_stack = [node]
+        while node_stack:
+            node = node_stack.pop()
+            if node:
+                total += 1
+                node_stack.append(node.left)
+                node_stack.append(node.right)
+        return total
+
+    @staticmethod
+    def values_below(node: Optional[SimpleBinaryTreeNode]) -> list[int]:
+        """Return the values in a subtree in ascending order"""
+        values = []
+        node_stack = []
+        while node_stack or node:
+            if node:
+                node_stack.append(node)
+                node = node.left
+            else:
+                node = node_stack.pop()
+                values.append(node.value)
+                node = node.right
+        return values
+
+    def rebuild_scapegoat(self, path: list[SimpleBinaryTreeNode]) -> bool:
+        """
+        Rebuild the subtree of the scapegoat of a newly inserted node if it landed too deep, and return whether we did
+
+        The path holds the nodes from the root to the new node. Only called in scapegoat mode
+        """
+        if len(path) - 1 <= math.log(self.size, 1 / self.alpha):
+            return False
+        child_size = 1
+        for i in range(len(path) - 2, -1, -1):
+            node = path[i]
+            sibling = node.right if node.left == path[i + 1] else node.left
+            node_size = child_size + SimpleBinaryTree.count(sibling) + 1
+            if child_size > self.alpha * node_size:
+                replacement = self.build(SimpleBinaryTree.values_below(node))
+                if i == 0:
+                    self.root = replacement
+                    # Like any full rebuild, this resets the size that deletions are measured against
+                    self.max_size = self.size
+                elif path[i - 1].left == node:
+                    path[i - 1].left = replacement
+                else:
+                    path[i - 1].right = replacement
+                return True
+            child_size = node_size
+        return False
+
+    def rebuild_if_sparse(self):
+        """Rebuild the whole tree if deletions have shrunk it below alpha times its size at the last full rebuild"""
+        if self.alpha is not None and self.size < self.alpha * self.max_size:
+            self.rebuild(self.list())
+
+    def rebuild(self, values: list[int]):
+        """Replace the contents of the tree with a list of sorted, distinct values in linear time"""
+        super().rebuild(values)
+        self.max_size = self.size
+
+    def remove_node(self, parent: Optional[SimpleBinaryTreeNode], current: SimpleBinaryTreeNode):
+        """Remove a node from the tree, replacing it with its in-order successor if it has a right child"""
+        replacement = None
+        if not current.right:
+            replacement = current.left
+        elif not current.right.left:
+            current.right.left = current.left
+            replacement = current.right
+        # Replace the current node with the smallest value among current.right and its children
+        else:
+            replacement = current.right.left
+            parent_of_replacement = current.right
+            while replacement.left:
+                parent_of_replacement = replacement
+                replacement = replacement.left
+            parent_of_replacement.left = replacement.right
+            replacement.left = current.left
+            replacement.right = current.right
+
+        if not parent:
+            self.root = replacement
+        elif parent.value > current.value:
+            parent.left = replacement
+        else:
+            parent.right = replacement
+        self.size -= 1
+
     def delete(self, value: int) -> bool:
         """Delete a value from the tree and return whether it was found"""
         if not self.root:
@@ -61,30 +210,139 @@ class SimpleBinaryTree(BinaryTree):
                 current = current.right
             # Delete the current node
             else:
-                replacement = None
-                if not current.right:
-                    replacement = current.left
-                elif not current.right.left:
-                    current.right.left = current.left
-                    replacement = current.right
-                # Replace the current node with the smallest value among current.right and its children
-                else:
-                    replacement = current.right.left
-                    parent_of_replacement = current.right
-                    while replacement.left:
-                        parent_of_replacement = replacement
-                        replacement = replacement.left
-                    parent_of_replacement.left = replacement.right
-                    replacement.left = current.left
-                    replacement.right = current.right
-
-                if not parent:
-                    self.root = replacement
-                elif parent.value > current.value:
-                    parent.left = replacement
-                else:
-                    parent.right = replacement
+                self.remove_node(parent, current)
+                self.rebuild_if_sparse()
                 return True
 
         # Value not found in the tree
         return False
+
+    @staticmethod
+    def seek(path: list[tuple[SimpleBinaryTreeNode, Optional[int]]], value: int):
+        """
+        Move a finger toward a value no smaller than the last one it was moved toward
+
+        The path holds the nodes from the root to the finger, each paired with the exclusive upper bound of its
+        subtree (None if unbounded). We pop back to the lowest node whose subtree can hold the value and descend
+        from there, stopping at the node holding the value or at the node the value would hang from
+        """
+        while len(path) > 1 and path[-1][1] is not None and path[-1][1] <= value:
+            path.pop()
+        while True:
+            current, upper = path[-1]
+            if value < current.value and current.left:
+                path.append((current.left, current.value))
+            elif value > current.value and current.right:
+                path.append((current.right, upper))
+            else:
+                return
+
+    def sweep_insert(self, batch: list[int]) -> set[int]:
+        """Insert a sorted batch in one ascending pass, resuming each search from the previous position"""
+        inserted = set()
+        if not batch:
+            return inserted
+        if not self.root:
+            self.insert(batch[0])
+            inserted.add(batch[0])
+        path = [(self.root, None)]
+        for value in batch:
+            SimpleBinaryTree.seek(path, value)
+            current, upper = path[-1]
+            if value < current.value:
+                current.left = SimpleBinaryTreeNode(value)
+                path.append((current.left, current.value))
+            elif value > current.value:
+                current.right = SimpleBinaryTreeNode(value)
+                path.append((current.right, upper))
+            else:
+                continue
+            inserted.add(value)
+            self.size += 1
+            self.max_size = max(self.max_size, self.size)
+            # A rebuild can move the nodes on the path, so we restart from the root
+            if self.alpha is not None and self.rebuild_scapegoat([node for node, _ in path]):
+                path = [(self.root, None)]
+        return inserted
+
+    def sweep_delete(self, batch: list[int]) -> set[int]:
+        """Delete a sorted batch in one ascending pass, resuming each search from the previous position"""
+        deleted = set()
+        if not self.root:
+            return deleted
+        path = [(self.root, None)]
+        for value in batch:
+            SimpleBinaryTree.seek(path, value)
+            current, _ = path[-1]
+            if value != current.value:
+                continue
+            path.pop()
+            self.remove_node(path[-1][0] if path else None, current)
+            deleted.add(value)
+            # Removing the root leaves nothing to resume from, so we restart from the new root
+            if not path:
+                if not self.root:
+                    break
+                path.append((self.root, None))
+        self.rebuild_if_sparse()
+        return deleted
+
+    def build(self, values: list[int], low: int = 0, high: Optional[int] = None) -> Optional[SimpleBinaryTreeNode]:
+        """Build a balanced subtree from values[low:high], which must be sorted and distinct"""
+        if high is None:
+            high = len(values)
+        if low >= high:
+            return None
+        middle = (low + high) // 2
+        node = SimpleBinaryTreeNode(values[middle])
+        node.left = self.build(values, low, middle)
+        node.right = self.build(values, middle + 1, high)
+        return node
+
+    def rebalance(self):
+        """
+        Rebalance the whole tree in place with the Day-Stout-Warren algorithm
+
+        We first rotate the tree into a sorted vine of right children, then fold the vine back into a balanced tree
+        with rounds of left rotations. This takes linear time and constant extra space
+        """
+        pseudo_root = SimpleBinaryTreeNode(0)
+        pseudo_root.right = self.root
+
+        # Tree to vine
+        tail = pseudo_root
+        rest = tail.right
+        size = 0
+        while rest:
+            if rest.left:
+                left = rest.left
+                rest.left = left.right
+                left.right = rest
+                rest = left
+                tail.right = left
+            else:
+                tail = rest
+                rest = rest.right
+                size += 1
+
+        # Vine to tree, first placing the leaves of the bottom level so that every later round is complete
+        leaves = size + 1 - (1 << ((size + 1).bit_length() - 1))
+        SimpleBinaryTree.compress(pseudo_root, leaves)
+        size -= leaves
+        while size > 1:
+            size //= 2
+            SimpleBinaryTree.compress(pseudo_root, size)
+
+        self.root = pseudo_root.right
+        self.max_size = self.size
+
+    @staticmethod
+    def compress(pseudo_root: SimpleBinaryTreeNode, count: int):
+        """Rotate every other node among the first 2 * count nodes of the right spine up to the left"""
+        scanner = pseudo_root
+        for _ in range(count):
+            child = scanner.right
+            scanner.right = child.right
+            scanner = scanner.right
+            child.right = scanner.left
+            scanner.left = child
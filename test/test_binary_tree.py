@@ -1,8 +1,19 @@
+import asyncio
+import errno
+import gc
+import os
+from concurrent.futures import ThreadPoolExecutor
 import random
-from time import perf_counter
+import stat
+import threading
+from time import perf_counter, sleep
 
+import pytest
+
+from src.async_tree import AsyncTree
 from src.avl_tree import AVLTree
-from src.binary_tree import BinaryTree
+from src.binary_tree import BinaryTree, BinaryTreeNode
+from src.durable_tree import DurableTree
 from src.simple_binary_tree import SimpleBinaryTree
 from src.red_black_binary_tree import RedBlackBinaryTree
 
@@ -25,6 +36,21 @@ class TimerContextManager:
         print(f'{self.name}: {self.end - self.start:.3f} seconds')
 
 
+class BenchmarkTimerContextManager(TimerContextManager):
+    """Context manager to time a block of code with garbage collection out of the way"""
+
+    def __enter__(self):
+        """Collect garbage left by earlier blocks, then start the timer with collection paused"""
+        gc.collect()
+        gc.disable()
+        return super().__enter__()
+
+    def __exit__(self, *args):
+        """End the timer and resume garbage collection"""
+        super().__exit__(*args)
+        gc.enable()
+
+
 def binary_tree_general_functionality(tree: BinaryTree):
     """Test general functionality of a binary tree"""
     # Test inserting nodes into the tree
@@ -115,6 +141,70 @@ def binary_tree_big_tree_random_insertion(tree: BinaryTree):
         assert not tree.lookup(i)
 
 
+def binary_tree_height(node: BinaryTreeNode) -> int:
+    """Return the number of nodes on the longest path from a node down to a leaf"""
+    height = 0
+    level = [node] if node else []
+    while level:
+        height += 1
+        level = [child for node in level for child in (node.left, node.right) if child]
+    return height
+
+
+def binary_tree_batch_operations(tree: BinaryTree):
+    """Test batched insertion and deletion, through both the sweep and the rebuild paths"""
+    # Batches larger than the tree take the rebuild path
+    assert tree.insert_many([5, 1, 9, 1, 3]) == [True, True, True, False, True]
+    assert tree.list() == [1, 3, 5, 9]
+    assert len(tree) == 4
+    assert tree.insert_many(range(10, 110)) == [True] * 100
+
+    # Small batches relative to the tree take the sweep path
+    assert tree.insert_many([200, 3, 150, 200]) == [True, False, True, False]
+    assert tree.list() == [1, 3, 5, 9] + list(range(10, 110)) + [150, 200]
+    assert tree.delete_many([150, 4, 9, 150]) == [True, False, True, False]
+    assert not tree.lookup(150)
+    assert not tree.lookup(9)
+    assert len(tree) == 104
+
+    # Batches larger than the tree take the rebuild path
+    assert tree.delete_many(range(0, 300)) == [value in {1, 3, 5, 200} or 10 <= value < 110 for value in range(0, 300)]
+    assert tree.list() == []
+    assert tree.insert_many([200] + list(range(100, 110))) == [True] * 11
+    assert tree.list() == list(range(100, 110)) + [200]
+    assert tree.delete_many([200, 100, 200]) == [True, True, False]
+    assert tree.list() == list(range(101, 110))
+    assert len(tree) == 9
+
+
+def binary_tree_batch_benchmark(tree_class: type[BinaryTree], name: str):
+    """Compare batched and one-at-a-time updates over several batch-to-tree size ratios"""
+    random.seed(1)
+    n = 20000
+    population = random.sample(range(1, 20 * n), 5 * n)
+    base = population[:n]
+    for ratio in (0.01, 0.1, 1.0, 4.0):
+        batch = population[n:n + int(ratio * n)]
+
+        single = tree_class()
+        single.insert_many(base)
+        with BenchmarkTimerContextManager(f"{name}, Batch Ratio {ratio}, One at a Time Insert"):
+            for value in batch:
+                single.insert(value)
+        with BenchmarkTimerContextManager(f"{name}, Batch Ratio {ratio}, One at a Time Delete"):
+            for value in batch:
+                single.delete(value)
+
+        batched = tree_class()
+        batched.insert_many(base)
+        with BenchmarkTimerContextManager(f"{name}, Batch Ratio {ratio}, Batched Insert"):
+            assert all(batched.insert_many(batch))
+        assert batched.list() == sorted(base + batch)
+        with BenchmarkTimerContextManager(f"{name}, Batch Ratio {ratio}, Batched Delete"):
+            assert all(batched.delete_many(batch))
+        assert batched.list() == single.list()
+
+
 def test_simple_binary_tree_general_functionality():
     """Test the general functionality of a simple binary tree"""
     with TimerContextManager("Simple Binary Tree, General Functionality"):
@@ -133,6 +223,65 @@ def test_simple_binary_tree_big_tree_random_insertion():
         binary_tree_big_tree_random_insertion(SimpleBinaryTree())
 
 
+def test_simple_binary_tree_batch_operations():
+    """Test batched insertion and deletion in a simple binary tree"""
+    with TimerContextManager("Simple Binary Tree, Batch Operations"):
+        binary_tree_batch_operations(SimpleBinaryTree())
+
+
+def test_simple_binary_tree_batch_benchmark():
+    """Benchmark batched updates in a simple binary tree"""
+    binary_tree_batch_benchmark(SimpleBinaryTree, "Simple Binary Tree")
+
+
+def test_scapegoat_binary_tree_general_functionality():
+    """Test the general functionality of a simple binary tree in scapegoat mode"""
+    with TimerContextManager("Scapegoat Binary Tree, General Functionality"):
+        binary_tree_general_functionality(SimpleBinaryTree(alpha=0.7))
+
+
+def test_scapegoat_binary_tree_big_tree_linear_insertion():
+    """Test a big tree with linear insertion in a simple binary tree in scapegoat mode"""
+    with TimerContextManager("Scapegoat Binary Tree, Big Tree Linear Insertion"):
+        binary_tree_big_tree_linear_insertion(SimpleBinaryTree(alpha=0.7))
+
+
+def test_scapegoat_binary_tree_big_tree_random_insertion():
+    """Test a big tree with random insertion in a simple binary tree in scapegoat mode"""
+    with TimerContextManager("Scapegoat Binary Tree, Big Tree Random Insertion"):
+        binary_tree_big_tree_random_insertion(SimpleBinaryTree(alpha=0.7))
+
+
+def test_scapegoat_binary_tree_depth():
+    """Test that scapegoat mode bounds the depth of a tree built by linear insertion"""
+    tree = SimpleBinaryTree(alpha=0.7)
+    for i in range(1, 10001):
+        assert tree.insert(i)
+    # log base 1 / 0.7 of 10000 is about 25.8
+    assert binary_tree_height(tree.root) <= 26
+    assert tree.insert_many(range(10001, 10101)) == [True] * 100
+    assert binary_tree_height(tree.root) <= 27
+    assert tree.list() == list(range(1, 10101))
+
+
+def test_simple_binary_tree_rebalance():
+    """Test rebalancing a degenerate simple binary tree in place"""
+    tree = SimpleBinaryTree()
+    for i in range(1, 10001):
+        assert tree.insert(i)
+    assert binary_tree_height(tree.root) == 10000
+    with TimerContextManager("Simple Binary Tree, Rebalance"):
+        tree.rebalance()
+    assert binary_tree_height(tree.root) == 14
+    assert tree.list() == list(range(1, 10001))
+    assert tree.lookup(1)
+    assert tree.lookup(10000)
+    assert not tree.lookup(10001)
+    tree = SimpleBinaryTree()
+    tree.rebalance()
+    assert tree.list() == []
+
+
 def test_red_black_binary_tree_general_functionality():
     """Test the general functionality of a red-black binary tree"""
     with TimerContextManager("Red Black Binary Tree, General Functionality"):
@@ -151,7 +300,410 @@ def test_red_black_binary_tree_big_tree_random_insertion():
         binary_tree_big_tree_random_insertion(RedBlackBinaryTree())
 
 
+def test_red_black_binary_tree_batch_operations():
+    """Test batched insertion and deletion in a red-black binary tree"""
+    with TimerContextManager("Red Black Binary Tree, Batch Operations"):
+        binary_tree_batch_operations(RedBlackBinaryTree())
+
+
+def test_red_black_binary_tree_batch_benchmark():
+    """Benchmark batched updates in a red-black binary tree"""
+    binary_tree_batch_benchmark(RedBlackBinaryTree, "Red Black Binary Tree")
+
+
+def test_lazy_red_black_binary_tree_general_functionality():
+    """Test the general functionality of a red-black binary tree with lazy deletion"""
+    with TimerContextManager("Lazy Red Black Binary Tree, General Functionality"):
+        binary_tree_general_functionality(RedBlackBinaryTree(lazy=True))
+
+
+def test_lazy_red_black_binary_tree_big_tree_random_insertion():
+    """Test a big tree with random insertion in a red-black binary tree with lazy deletion"""
+    with TimerContextManager("Lazy Red Black Binary Tree, Big Tree Random Insertion"):
+        binary_tree_big_tree_random_insertion(RedBlackBinaryTree(lazy=True))
+
+
+def test_lazy_red_black_binary_tree_tombstones():
+    """Test that tombstones are skipped, revived, and compacted away"""
+    tree = RedBlackBinaryTree(lazy=True, compaction_threshold=0.5)
+    assert tree.insert_many(range(10)) == [True] * 10
+    for i in range(5):
+        assert tree.delete(i)
+        assert not tree.delete(i)
+        assert not tree.lookup(i)
+    assert tree.tombstones == 5
+    assert len(tree) == 5
+    assert tree.list() == [5, 6, 7, 8, 9]
+
+    # Reinserting a deleted value revives its node
+    assert tree.insert(0)
+    assert tree.tombstones == 4
+    assert tree.list() == [0, 5, 6, 7, 8, 9]
+
+    # More than half of the nodes are tombstones after this, which compacts the tree
+    assert tree.delete(5)
+    assert tree.delete(6)
+    assert tree.tombstones == 0
+    assert binary_tree_height(tree.root) == 3
+    assert tree.list() == [0, 7, 8, 9]
+
+
+def test_lazy_red_black_binary_tree_delete_burst_benchmark():
+    """Compare eager and lazy deletion on bursts of deletes between lookups"""
+    random.seed(1)
+    n = 100000
+    burst = 5000
+    deleted = 3 * n // 5
+    r = random.sample(range(1, 10 * n), n)
+    for name, tree in (
+        ("Eager", RedBlackBinaryTree()),
+        ("Lazy, Threshold 0.25", RedBlackBinaryTree(lazy=True, compaction_threshold=0.25)),
+        ("Lazy, Threshold 0.5", RedBlackBinaryTree(lazy=True, compaction_threshold=0.5)),
+    ):
+        tree.insert_many(r)
+        with TimerContextManager(f"Red Black Binary Tree, {name} Delete Bursts"):
+            for start in range(0, deleted, burst):
+                for value in r[start:start + burst]:
+                    assert tree.delete(value)
+                for value in r[n - burst:]:
+                    assert tree.lookup(value)
+        assert tree.list() == sorted(r[deleted:])
+
+
 def test_avl_tree_general_functionality():
     """Test the general functionality of an AVL tree"""
     with TimerContextManager("AVL Tree, General Functionality"):
         binary_tree_general_functionality(AVLTree())
+
+
+def test_avl_tree_batch_operations():
+    """Test batched insertion and deletion in an AVL tree"""
+    with TimerContextManager("AVL Tree, Batch Operations"):
+        binary_tree_batch_operations(AVLTree())
+
+
+def test_durable_tree_general_functionality(tmp_path):
+    """Test the general functionality of a durable tree"""
+    with TimerContextManager("Durable Tree, General Functionality"):
+        with DurableTree(RedBlackBinaryTree(), tmp_path) as tree:
+            binary_tree_general_functionality(tree)
+
+
+def test_durable_tree_recovery(tmp_path):
+    """Test recovering a durable tree from its snapshot and log, including a torn final record"""
+    tree = DurableTree(RedBlackBinaryTree(), tmp_path, checkpoint_interval=100)
+    assert tree.insert_many(range(250)) == [True] * 250
+    for i in range(0, 250, 2):
+        assert tree.delete(i)
+    assert not tree.delete(0)
+    # Simulate a crash: every committed update has already been synced, so we just abandon the tree
+    tree.log_file.close()
+
+    tree = DurableTree(SimpleBinaryTree(), tmp_path)
+    assert tree.list() == list(range(1, 250, 2))
+    assert tree.insert(0)
+    tree.close()
+
+    # A crash in the middle of appending a record leaves a partial record at the end of the log
+    with open(os.path.join(tmp_path, "wal"), "ab") as log:
+        log.write(b"\x01\x02\x03")
+    tree = DurableTree(RedBlackBinaryTree(), tmp_path)
+    assert tree.list() == [0] + list(range(1, 250, 2))
+    assert tree.delete(0)
+    tree.close()
+    tree = DurableTree(RedBlackBinaryTree(), tmp_path)
+    assert tree.list() == list(range(1, 250, 2))
+    tree.close()
+
+
+def test_durable_tree_rejects_out_of_range_values(tmp_path):
+    """Test that values the log cannot hold are rejected before the tree changes"""
+    tree = DurableTree(RedBlackBinaryTree(), tmp_path)
+    with pytest.raises(ValueError):
+        tree.insert(2 ** 64)
+    with pytest.raises(ValueError):
+        tree.insert_many([1, 2, 2 ** 64, 3])
+    assert tree.list() == []
+    assert tree.insert_many([1, 2, 3]) == [True, True, True]
+    with pytest.raises(ValueError):
+        tree.delete_many([1, -2 ** 64])
+    assert tree.list() == [1, 2, 3]
+    tree.close()
+    with DurableTree(RedBlackBinaryTree(), tmp_path) as tree:
+        assert tree.list() == [1, 2, 3]
+
+
+def test_durable_tree_syncs_directory_of_new_log(tmp_path, monkeypatch):
+    """Test that creating the log fsyncs its directory, and reopening an existing log does not"""
+    synced_directories = []
+    fsync = os.fsync
+
+    def recording_fsync(descriptor: int):
+        if stat.S_ISDIR(os.fstat(descriptor).st_mode):
+            synced_directories.append(descriptor)
+        fsync(descriptor)
+
+    monkeypatch.setattr(os, "fsync", recording_fsync)
+    DurableTree(RedBlackBinaryTree(), tmp_path).close()
+    assert len(synced_directories) == 1
+    DurableTree(RedBlackBinaryTree(), tmp_path).close()
+    assert len(synced_directories) == 1
+
+
+class HeldFsync:
+    """Replacement for os.fsync that holds the first call open until released"""
+
+    def __init__(self, fsync):
+        self.fsync = fsync
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, descriptor: int):
+        self.calls += 1
+        if self.calls == 1:
+            self.started.set()
+            self.release.wait()
+        self.fsync(descriptor)
+
+
+def test_durable_tree_answers_wait_for_durability(tmp_path, monkeypatch):
+    """Test that answers computed from updates still being synced wait for the sync to finish"""
+    tree = DurableTree(RedBlackBinaryTree(), tmp_path)
+    held = HeldFsync(os.fsync)
+    monkeypatch.setattr(os, "fsync", held)
+    writer = threading.Thread(target=tree.insert, args=(5,))
+    writer.start()
+    held.started.wait()
+
+    results = []
+    readers = [
+        threading.Thread(target=lambda: results.append(tree.insert(5))),
+        threading.Thread(target=lambda: results.append(tree.lookup(5))),
+    ]
+    for reader in readers:
+        reader.start()
+    sleep(0.1)
+    try:
+        assert results == []
+    finally:
+        held.release.set()
+    for thread in [writer] + readers:
+        thread.join()
+    assert sorted(results) == [False, True]
+    tree.close()
+
+
+def test_durable_tree_group_commit(tmp_path, monkeypatch):
+    """Test that writers waiting behind an fsync share the next one"""
+    tree = DurableTree(RedBlackBinaryTree(), tmp_path)
+    held = HeldFsync(os.fsync)
+    monkeypatch.setattr(os, "fsync", held)
+    writers = [threading.Thread(target=tree.insert, args=(0,))]
+    writers[0].start()
+    held.started.wait()
+
+    writers += [threading.Thread(target=tree.insert, args=(i,)) for i in range(1, 8)]
+    for writer in writers[1:]:
+        writer.start()
+    # Every writer has applied and buffered its update once all eight records are logged
+    try:
+        while tree.logged < 8:
+            sleep(0.001)
+    finally:
+        held.release.set()
+    for writer in writers:
+        writer.join()
+    assert tree.syncs == 2
+    assert held.calls == 2
+    tree.close()
+    with DurableTree(RedBlackBinaryTree(), tmp_path) as tree:
+        assert tree.list() == list(range(8))
+
+
+def test_durable_tree_concurrent_writers(tmp_path):
+    """Benchmark sustained write throughput of a durable tree with several concurrent writers"""
+    n = 2000
+    for threads in (1, 8):
+        directory = os.path.join(tmp_path, str(threads))
+        tree = DurableTree(RedBlackBinaryTree(), directory)
+        per_thread = n // threads
+
+        def write(start: int):
+            for value in range(start, start + per_thread):
+                assert tree.insert(value)
+
+        workers = [threading.Thread(target=write, args=(i * per_thread,)) for i in range(threads)]
+        with TimerContextManager(f"Durable Tree, {n} Inserts from {threads} Threads") as timer:
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        print(f"{n / (timer.end - timer.start):.0f} inserts per second, {tree.syncs} fsyncs")
+        if threads == 1:
+            assert tree.syncs == n
+        else:
+            assert tree.syncs < n
+        tree.close()
+        with DurableTree(RedBlackBinaryTree(), directory) as tree:
+            assert tree.list() == list(range(n))
+
+
+def test_durable_tree_recovery_benchmark(tmp_path):
+    """Benchmark recovery time as a function of the length of the log"""
+    random.seed(1)
+    n = 100000
+    r = random.sample(range(1, 10 * n), n)
+    for tail in (0, 10000, 50000):
+        directory = os.path.join(tmp_path, str(tail))
+        tree = DurableTree(RedBlackBinaryTree(), directory)
+        tree.insert_many(r[:n - tail])
+        tree.checkpoint()
+        tree.insert_many(r[n - tail:])
+        tree.close()
+        with TimerContextManager(f"Durable Tree, Recovery of {n - tail} Snapshot Values and {tail} Log Records"):
+            recovered = DurableTree(RedBlackBinaryTree(), directory)
+        assert len(recovered) == n
+        recovered.close()
+
+
+def test_async_tree_coalescing():
+    """Test that concurrent requests to an async tree are coalesced and each get their own result"""
+
+    async def run():
+        tree = AsyncTree(RedBlackBinaryTree())
+        results = await asyncio.gather(*[tree.insert(i % 50) for i in range(200)])
+        assert results == [True] * 50 + [False] * 150
+        assert tree.batches == 1
+
+        results = await asyncio.gather(
+            tree.lookup(3), tree.range(10, 14), tree.delete(3), tree.delete(3), tree.lookup(100), tree.insert(100)
+        )
+        assert results == [True, [10, 11, 12, 13, 14], True, False, False, True]
+        assert tree.batches == 2
+        assert not await tree.lookup(3)
+        assert await tree.range(48, 1000) == [48, 49, 100]
+
+    asyncio.run(run())
+
+
+def test_async_tree_failures_stay_with_their_request(tmp_path):
+    """Test that a failing request in a batch fails only its own future"""
+
+    async def run():
+        tree = AsyncTree(RedBlackBinaryTree())
+        results = await asyncio.gather(
+            tree.insert(1), tree.lookup("x"), tree.range(0, None), tree.insert(2), tree.lookup(1),
+            return_exceptions=True,
+        )
+        assert results[0] is True
+        assert isinstance(results[1], TypeError)
+        assert isinstance(results[2], TypeError)
+        assert results[3:] == [True, False]
+        assert await tree.range(0, 10) == [1, 2]
+
+        # Values the log cannot hold are rejected by the durable tree, and the rest of the batch still applies
+        durable = DurableTree(RedBlackBinaryTree(), tmp_path)
+        tree = AsyncTree(durable)
+        results = await asyncio.gather(tree.insert(10), tree.insert(2 ** 70), tree.insert(11), return_exceptions=True)
+        assert results[0] is True
+        assert isinstance(results[1], ValueError)
+        assert results[2] is True
+        durable.close()
+        with DurableTree(RedBlackBinaryTree(), tmp_path) as recovered:
+            assert recovered.list() == [10, 11]
+
+    asyncio.run(run())
+
+
+def test_async_tree_fsync_failure(tmp_path, monkeypatch):
+    """Test that a failed fsync behind an async tree fails every request in its group instead of being retried"""
+    durable = DurableTree(RedBlackBinaryTree(), tmp_path)
+    fsync = os.fsync
+    failures = [OSError(errno.EIO, "Injected fsync failure")]
+
+    def failing_fsync(descriptor: int):
+        if failures:
+            raise failures.pop()
+        fsync(descriptor)
+
+    monkeypatch.setattr(os, "fsync", failing_fsync)
+
+    async def run():
+        tree = AsyncTree(durable)
+        results = await asyncio.gather(tree.insert(1), tree.insert(2), return_exceptions=True)
+        assert all(isinstance(result, OSError) for result in results)
+
+    asyncio.run(run())
+    # The outcome of the failed requests was unknown; the next successful sync makes them durable
+    durable.close()
+    with DurableTree(RedBlackBinaryTree(), tmp_path) as recovered:
+        assert recovered.list() == [1, 2]
+
+
+def test_async_tree_executor_failure():
+    """Test that a batch the executor refuses fails its requests instead of hanging later ones"""
+
+    async def run():
+        executor = ThreadPoolExecutor()
+        executor.shutdown()
+        tree = AsyncTree(RedBlackBinaryTree(), executor)
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                await asyncio.wait_for(tree.insert(1), timeout=1)
+        assert not tree.busy
+
+    asyncio.run(run())
+
+
+def async_tree_load_test(name: str, lookup, insert, clients: int, requests: int):
+    """Run concurrent clients issuing random lookups and inserts and report throughput and tail latency"""
+    latencies = []
+
+    async def client():
+        for _ in range(requests):
+            value = random.randint(1, 100000)
+            start = perf_counter()
+            if random.random() < 0.8:
+                await lookup(value)
+            else:
+                await insert(value)
+            latencies.append(perf_counter() - start)
+
+    async def run():
+        await asyncio.gather(*[client() for _ in range(clients)])
+
+    with TimerContextManager(name) as timer:
+        asyncio.run(run())
+    latencies.sort()
+    print(
+        f"{len(latencies) / (timer.end - timer.start):.0f} requests per second, "
+        f"p50 {1000 * latencies[len(latencies) // 2]:.2f} ms, p99 {1000 * latencies[len(latencies) * 99 // 100]:.2f} ms"
+    )
+
+
+def test_async_tree_load_benchmark():
+    """Compare an async tree against calling run_in_executor once per request"""
+    random.seed(1)
+    clients = 200
+    requests = 50
+
+    tree = RedBlackBinaryTree()
+    tree.insert_many(random.sample(range(1, 100001), 50000))
+    lock = threading.Lock()
+
+    def locked(method, value: int):
+        with lock:
+            return method(value)
+
+    async def naive_lookup(value: int) -> bool:
+        return await asyncio.get_running_loop().run_in_executor(None, locked, tree.lookup, value)
+
+    async def naive_insert(value: int) -> bool:
+        return await asyncio.get_running_loop().run_in_executor(None, locked, tree.insert, value)
+
+    async_tree_load_test("Per-Call run_in_executor, Load Test", naive_lookup, naive_insert, clients, requests)
+
+    coalesced = AsyncTree(tree)
+    async_tree_load_test("Async Tree, Load Test", coalesced.lookup, coalesced.insert, clients, requests)
+    print(f"{coalesced.batches} batches for {clients * requests} requests")